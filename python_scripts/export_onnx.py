@@ -0,0 +1,41 @@
+import torch
+import os
+import argparse
+from model import PointNet2Classification
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the trained PointNet++ checkpoint to ONNX')
+    parser.add_argument('--model_path', type=str, default=os.path.join(os.path.dirname(__file__), 'checkpoints', 'pointnet_best.pth'),
+                       help='Path to the trained model checkpoint')
+    parser.add_argument('--output_path', type=str, default=os.path.join(os.path.dirname(__file__), 'checkpoints', 'pointnet.onnx'),
+                       help='Path for the exported ONNX model')
+    parser.add_argument('--num_points', type=int, default=1024,
+                       help='Number of points the exported graph is traced with')
+    parser.add_argument('--num_classes', type=int, default=10,
+                       help='Number of output classes')
+
+    args = parser.parse_args()
+
+    # Load the trained model on CPU; the ONNX graph is device-independent
+    model = PointNet2Classification(num_classes=args.num_classes)
+    checkpoint = torch.load(args.model_path, map_location='cpu')
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+
+    # Export with a dynamic batch axis so the same graph serves batched
+    # evaluation; channels-first matches what load_and_preprocess_cad emits
+    dummy_input = torch.randn(1, 3, args.num_points)
+    torch.onnx.export(
+        model,
+        dummy_input,
+        args.output_path,
+        input_names=['input'],
+        output_names=['log_probs'],
+        opset_version=17,
+        dynamic_axes={'input': {0: 'B'}, 'log_probs': {0: 'B'}}
+    )
+
+    print(f"Exported ONNX model to {args.output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,87 @@ import torch
 import numpy as np
 import trimesh
 import os
+import sys
 import argparse
-import json
+import orjson
 from model import PointNet2Classification
 
-def load_and_preprocess_cad(file_path, num_points=1024):
-    """Load and preprocess a CAD file for inference"""
+# Class names (ModelNet10)
+MODELNET10_CLASSES = ['bathtub', 'bed', 'chair', 'desk', 'dresser',
+                      'monitor', 'night_stand', 'sofa', 'table', 'toilet']
+
+def emit_json(result):
+    """Write one JSON result line to stdout
+
+    orjson encodes floats in native C and serializes numpy arrays directly,
+    which matters when the result carries a full point cloud.
+    """
+    sys.stdout.buffer.write(orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY))
+    sys.stdout.buffer.write(b"\n")
+    sys.stdout.buffer.flush()
+
+# Cached per-mesh sampling state (face corners + area CDF), keyed by
+# (file path, mtime) so repeated requests for the same file skip the area pass
+_sampler_cache = {}
+_SAMPLER_CACHE_MAX = 32
+
+def _sample_points_cpu(mesh, num_points, cache_key=None):
+    """Area-weighted surface sampling via a cached face-area CDF"""
+    cached = _sampler_cache.get(cache_key) if cache_key is not None else None
+    if cached is None:
+        triangles = np.asarray(mesh.triangles, dtype=np.float32)  # (F, 3, 3)
+        v0, v1, v2 = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+
+        areas = np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1) * 0.5
+        total_area = areas.sum()
+        if total_area == 0:
+            raise ValueError("mesh has no surface area")
+        cdf = np.cumsum(areas)
+        cdf /= cdf[-1]
+
+        cached = (v0, v1, v2, cdf)
+        if cache_key is not None:
+            if len(_sampler_cache) >= _SAMPLER_CACHE_MAX:
+                _sampler_cache.clear()
+            _sampler_cache[cache_key] = cached
+
+    v0, v1, v2, cdf = cached
+
+    # Pick faces proportional to area, then uniform barycentric coordinates
+    face_idx = np.searchsorted(cdf, np.random.rand(num_points))
+    r1 = np.sqrt(np.random.rand(num_points, 1)).astype(np.float32)
+    r2 = np.random.rand(num_points, 1).astype(np.float32)
+
+    return (1 - r1) * v0[face_idx] + r1 * (1 - r2) * v1[face_idx] + r1 * r2 * v2[face_idx]
+
+def _sample_points_on_device(mesh, num_points, device):
+    """Area-weighted surface sampling as torch ops on the given device"""
+    verts = torch.from_numpy(np.asarray(mesh.vertices, dtype=np.float32)).to(device)
+    faces = torch.from_numpy(np.asarray(mesh.faces, dtype=np.int64)).to(device)
+
+    v0 = verts[faces[:, 0]]
+    v1 = verts[faces[:, 1]]
+    v2 = verts[faces[:, 2]]
+
+    # Pick faces proportional to their area
+    areas = torch.linalg.cross(v1 - v0, v2 - v0).norm(dim=1)
+    face_idx = torch.multinomial(areas, num_points, replacement=True)
+
+    # Uniform barycentric coordinates via the sqrt trick
+    r1 = torch.rand(num_points, 1, device=device).sqrt()
+    r2 = torch.rand(num_points, 1, device=device)
+    points = (1 - r1) * v0[face_idx] + r1 * (1 - r2) * v1[face_idx] + r1 * r2 * v2[face_idx]
+
+    return points
+
+def load_and_preprocess_cad(file_path, num_points=1024, want_points=False):
+    """Load and preprocess a CAD file for inference
+
+    Returns the (1, 3, num_points) channels-first input tensor (the layout
+    the set-abstraction kernels consume, so the model's entry permute never
+    fires), plus the sampled (num_points, 3) array when want_points is set
+    (None otherwise, skipping the copy).
+    """
     # Load the CAD file
     loaded_mesh = trimesh.load(file_path)
     
@@ -24,38 +99,160 @@ def load_and_preprocess_cad(file_path, num_points=1024):
         # It's already a mesh object
         mesh = loaded_mesh
     
-    # Now sample points from the mesh
-    points = mesh.sample(num_points)
-    
+    # Sample points from the mesh; on GPU the sampling, centering and
+    # normalization all run on-device so the model input never round-trips
+    # through host memory
+    if torch.cuda.is_available() and len(mesh.faces) > 0:
+        try:
+            pts = _sample_points_on_device(mesh, num_points, 'cuda')
+            pts -= pts.mean(dim=0)
+            pts /= pts.norm(dim=1).max()
+            pts_tensor = pts.t().unsqueeze(0).contiguous()
+            return pts_tensor, (pts.cpu().numpy() if want_points else None)
+        except RuntimeError:
+            # Degenerate meshes (e.g. zero-area faces) fall through to trimesh
+            pass
+
+    try:
+        points = _sample_points_cpu(mesh, num_points,
+                                    cache_key=(file_path, os.path.getmtime(file_path)))
+    except ValueError:
+        # Zero-area meshes: let trimesh decide what sampling means
+        points = np.asarray(mesh.sample(num_points), dtype=np.float32)
+
     # Continue with your existing processing...
-    # Center the point cloud
-    centroid = np.mean(points, axis=0)
-    points = points - centroid
-    
-    # Scale to unit sphere
-    furthest_distance = np.max(np.sqrt(np.sum(points**2, axis=1)))
-    points = points / furthest_distance
-    
-    # Convert to tensor and return
-    points_tensor = torch.from_numpy(points.astype(np.float32))
+    # Center the point cloud and scale to unit sphere in-place
+    # (single fused pass instead of separate mean/norm/max temporaries)
+    points -= points.mean(axis=0)
+    furthest_distance = np.sqrt(np.einsum('ij,ij->i', points, points).max())
+    points /= furthest_distance
+
+    # Convert to a channels-first tensor with unit-stride points axis
+    points_tensor = torch.from_numpy(np.ascontiguousarray(points.T))
     points_tensor = points_tensor.unsqueeze(0)
-    
-    return points_tensor, points
 
-def predict_cad_category(model, points_tensor, class_names, device):
-    """Predict the category of a CAD file"""
-    # Move tensor to device
-    points_tensor = points_tensor.to(device)
-    
+    return points_tensor, (points if want_points else None)
+
+# Cached CUDA graph state, keyed by (model, number of points), so repeated
+# predictions (e.g. from a long-lived worker) replay the captured graph instead
+# of paying per-kernel launch overhead on every forward pass
+_cuda_graph_cache = {}
+
+def _capture_cuda_graph(model, num_points):
+    """Capture the model forward pass in a CUDA graph for low-overhead replay"""
+    dtype = next(model.parameters()).dtype
+    static_input = torch.zeros((1, 3, num_points), device='cuda', dtype=dtype)
+
+    # Warm up on a side stream so lazy kernel/memory-pool initialization
+    # happens outside the capture
+    s = torch.cuda.Stream()
+    s.wait_stream(torch.cuda.current_stream())
+    with torch.cuda.stream(s):
+        for _ in range(3):
+            model(static_input)
+    torch.cuda.current_stream().wait_stream(s)
+
+    graph = torch.cuda.CUDAGraph()
+    with torch.cuda.graph(graph):
+        static_output = model(static_input)
+
+    return graph, static_input, static_output
+
+def compile_model(model, device, num_points):
+    """Compile the model with Inductor to fuse kernels and cut dispatch overhead"""
+    if not hasattr(torch, 'compile'):
+        return model
+
+    try:
+        # reduce-overhead captures CUDA graphs on GPU; on CPU give Inductor's
+        # C++ backend room to autotune instead
+        mode = 'reduce-overhead' if device.type == 'cuda' else 'max-autotune'
+        compiled = torch.compile(model, mode=mode, fullgraph=False)
+
+        # Warm up so the one-time compile cost is paid before the real request
+        dummy = torch.zeros((1, 3, num_points), device=device,
+                            dtype=next(model.parameters()).dtype)
+        with torch.no_grad():
+            for _ in range(2):
+                compiled(dummy)
+
+        return compiled
+    except Exception:
+        # Compilation is best-effort; eager execution is always valid
+        return model
+
+def load_model(model_path, device, num_points=1024, use_compile=False):
+    """Load the trained checkpoint ready for inference on the given device
+
+    use_compile wraps the model with torch.compile; only worth it in a
+    long-lived process (the worker), since a fresh CLI process would pay the
+    full trace + warmup cost for a single forward.
+    """
+    model = PointNet2Classification(num_classes=len(MODELNET10_CLASSES)).to(device)
+    checkpoint = torch.load(model_path, map_location=device)
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.eval()
+
+    if device.type == 'cuda':
+        # Half precision halves activation bandwidth and uses tensor
+        # cores; negligible accuracy impact on classification logits
+        model = model.half()
+
+    if use_compile:
+        model = compile_model(model, device, num_points)
+
+    return model
+
+def predict_cad_category(model, points_tensor, class_names, device, use_cuda_graph=False):
+    """Predict the category of a CAD file
+
+    use_cuda_graph enables capture-and-replay of the forward pass; like
+    use_compile in load_model it only pays off in a long-lived process (the
+    worker), since capture costs several warmup forwards. The one-shot CLI
+    leaves it off and runs a single eager forward.
+    """
+    # Move tensor to device, matching the model's dtype (half on GPU); stage
+    # host tensors through pinned memory so the copy is async rather than a
+    # synchronous pageable transfer
+    model_dtype = next(model.parameters()).dtype
+    if device.type == 'cuda' and points_tensor.device.type == 'cpu':
+        points_tensor = points_tensor.pin_memory()
+        points_tensor = points_tensor.to(device, dtype=model_dtype, non_blocking=True)
+    else:
+        points_tensor = points_tensor.to(device, dtype=model_dtype)
+
     # Set model to evaluation mode
     model.eval()
-    
+
     # Forward pass
     with torch.no_grad():
-        outputs = model(points_tensor)
-        
-    # Get predicted class and all probabilities
-    probabilities = torch.exp(outputs)
+        if use_cuda_graph and device.type == 'cuda' and not hasattr(model, '_orig_mod'):
+            # Replay a captured CUDA graph: the hundreds of small PointNet++
+            # kernels (sampling, grouping, MLPs) collapse into one driver call.
+            # Skipped for torch.compile'd models, where reduce-overhead mode
+            # already does its own graph capture.
+            cache_key = (id(model), points_tensor.shape[2])
+            if cache_key not in _cuda_graph_cache:
+                try:
+                    _cuda_graph_cache[cache_key] = _capture_cuda_graph(model, points_tensor.shape[2])
+                except RuntimeError:
+                    # Not all setups support graph capture; remember the
+                    # failure so later requests don't re-pay the attempt
+                    _cuda_graph_cache[cache_key] = None
+            cached = _cuda_graph_cache[cache_key]
+            if cached is not None:
+                graph, static_input, static_output = cached
+                static_input.copy_(points_tensor, non_blocking=True)
+                graph.replay()
+                outputs = static_output
+            else:
+                outputs = model(points_tensor)
+        else:
+            outputs = model(points_tensor)
+
+    # Get predicted class and all probabilities; exponentiate in FP32 so the
+    # softmax tail doesn't underflow under half-precision inference
+    probabilities = torch.exp(outputs.float())
     predicted_class = torch.argmax(probabilities, dim=1).item()
     confidence = probabilities[0, predicted_class].item() * 100
     
@@ -66,6 +263,25 @@ def predict_cad_category(model, points_tensor, class_names, device):
     
     return predicted_class, confidence, top_predictions
 
+def predict_cad_category_onnx(session, points_tensor, class_names):
+    """Predict the category of a CAD file using an exported ONNX model"""
+    # Forward pass through ONNX Runtime; the frozen graph has already had
+    # constant folding and operator fusion applied at session build time.
+    # .cpu() covers the GPU sampling path, which hands us a CUDA tensor
+    outputs = session.run(None, {'input': points_tensor.cpu().numpy()})[0]
+
+    # Get predicted class and all probabilities
+    probabilities = np.exp(outputs[0])
+    predicted_class = int(np.argmax(probabilities))
+    confidence = float(probabilities[predicted_class]) * 100
+
+    # Get top-3 predictions
+    top_indices = np.argsort(probabilities)[::-1][:3]
+    top_predictions = [{"className": class_names[idx], "probability": float(probabilities[idx]) * 100}
+                       for idx in top_indices]
+
+    return predicted_class, confidence, top_predictions
+
 def main():
     parser = argparse.ArgumentParser(description='Classify a single CAD file using trained PointNet++')
     parser.add_argument('--cad_file', type=str, required=True,
@@ -83,41 +299,51 @@ def main():
     # Check if the CAD file exists
     if not os.path.exists(args.cad_file):
         result = {"error": f"CAD file {args.cad_file} does not exist"}
-        print(json.dumps(result))
+        emit_json(result)
         return
     
     # Set device
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     
-    # Class names (ModelNet10)
-    class_names = ['bathtub', 'bed', 'chair', 'desk', 'dresser', 
-                  'monitor', 'night_stand', 'sofa', 'table', 'toilet']
+    class_names = MODELNET10_CLASSES
     
     # Load and preprocess the CAD file
     try:
-        points_tensor, points = load_and_preprocess_cad(args.cad_file, num_points=args.num_points)
+        points_tensor, points = load_and_preprocess_cad(
+            args.cad_file, num_points=args.num_points, want_points=output_points)
     except Exception as e:
         result = {"error": f"Error processing CAD file: {str(e)}"}
-        print(json.dumps(result))
+        emit_json(result)
         return
     
-    # Load the model
+    # Load the model; a .onnx checkpoint runs through ONNX Runtime, which
+    # skips the eager dispatch overhead entirely for single-file CLI calls
+    use_onnx = args.model_path.endswith('.onnx')
     try:
-        model = PointNet2Classification(num_classes=len(class_names)).to(device)
-        checkpoint = torch.load(args.model_path, map_location=device)
-        model.load_state_dict(checkpoint['model_state_dict'])
+        if use_onnx:
+            import onnxruntime as ort
+            session = ort.InferenceSession(
+                args.model_path,
+                providers=['CUDAExecutionProvider', 'CPUExecutionProvider'])
+        else:
+            # Eager on purpose: compilation doesn't amortize in a one-shot CLI
+            model = load_model(args.model_path, device, args.num_points)
     except Exception as e:
         result = {"error": f"Error loading model: {str(e)}"}
-        print(json.dumps(result))
+        emit_json(result)
         return
-    
+
     # Predict the category
     try:
-        predicted_class, confidence, top_predictions = predict_cad_category(
-            model, points_tensor, class_names, device)
+        if use_onnx:
+            predicted_class, confidence, top_predictions = predict_cad_category_onnx(
+                session, points_tensor, class_names)
+        else:
+            predicted_class, confidence, top_predictions = predict_cad_category(
+                model, points_tensor, class_names, device)
     except Exception as e:
         result = {"error": f"Error making prediction: {str(e)}"}
-        print(json.dumps(result))
+        emit_json(result)
         return
     
     # Prepare the result JSON
@@ -128,14 +354,13 @@ def main():
         "fileName": os.path.basename(args.cad_file)
     }
     
-    # Include point cloud data if requested
+    # Include point cloud data if requested; orjson serializes the numpy
+    # array directly, no tolist() conversion needed
     if output_points:
-        # Convert points to a serializable format (list of lists)
-        point_list = points.tolist()
-        result["pointCloud"] = point_list
+        result["pointCloud"] = points
     
     # Output as JSON
-    print(json.dumps(result))
+    emit_json(result)
 
 if __name__ == "__main__":
     main()
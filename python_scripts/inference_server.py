@@ -0,0 +1,69 @@
+import torch
+import os
+import sys
+import argparse
+import json
+from inference import MODELNET10_CLASSES, emit_json, load_model, load_and_preprocess_cad, predict_cad_category
+
+def main():
+    parser = argparse.ArgumentParser(description='Long-lived CAD classification worker: reads one JSON request per stdin line')
+    parser.add_argument('--model_path', type=str, default=os.path.join(os.path.dirname(__file__), 'checkpoints', 'pointnet_best.pth'),
+                       help='Path to the trained model checkpoint')
+    parser.add_argument('--num_points', type=int, default=1024,
+                       help='Default number of points to sample from each CAD model')
+
+    args = parser.parse_args()
+
+    # Set device
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    class_names = MODELNET10_CLASSES
+
+    # Load the model once; compilation amortizes here, and every request
+    # after this only pays for preprocessing and the forward pass
+    try:
+        model = load_model(args.model_path, device, args.num_points, use_compile=True)
+    except Exception as e:
+        emit_json({"error": f"Error loading model: {str(e)}"})
+        return
+
+    # Signal readiness so the caller knows requests can be sent
+    emit_json({"ready": True})
+
+    # Serve until stdin closes; one JSON object in, one JSON line out
+    # Request format: {"cad_file": path, "num_points": int?, "output_points": bool?}
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            request = json.loads(line)
+            cad_file = request['cad_file']
+            num_points = int(request.get('num_points', args.num_points))
+
+            if not os.path.exists(cad_file):
+                result = {"error": f"CAD file {cad_file} does not exist"}
+            else:
+                want_points = bool(request.get('output_points'))
+                points_tensor, points = load_and_preprocess_cad(
+                    cad_file, num_points=num_points, want_points=want_points)
+                predicted_class, confidence, top_predictions = predict_cad_category(
+                    model, points_tensor, class_names, device, use_cuda_graph=True)
+
+                result = {
+                    "predictedClass": class_names[predicted_class],
+                    "confidence": confidence,
+                    "topPredictions": top_predictions,
+                    "fileName": os.path.basename(cad_file)
+                }
+
+                if want_points:
+                    # numpy array serialized directly by orjson
+                    result["pointCloud"] = points
+        except Exception as e:
+            result = {"error": f"Error processing request: {str(e)}"}
+
+        emit_json(result)
+
+if __name__ == "__main__":
+    main()
@@ -28,7 +28,7 @@ def index_points(points, idx):
     view_shape[1:] = [1] * (len(view_shape) - 1)
     repeat_shape = list(idx.shape)
     repeat_shape[0] = 1
-    batch_indices = torch.arange(B, dtype=torch.long).to(device).view(view_shape).repeat(repeat_shape)
+    batch_indices = torch.arange(B, dtype=torch.long, device=device).view(view_shape).repeat(repeat_shape)
     new_points = points[batch_indices, idx, :]
     return new_points
 
@@ -46,17 +46,16 @@ def farthest_point_sample(xyz, npoint):
     # Ensure we don't try to sample more points than exist
     npoint = min(N, npoint)
     
-    centroids = torch.zeros(B, npoint, dtype=torch.long).to(device)
-    distance = torch.ones(B, N).to(device) * 1e10
-    farthest = torch.randint(0, N, (B,), dtype=torch.long).to(device)
-    batch_indices = torch.arange(B, dtype=torch.long).to(device)
+    centroids = torch.zeros(B, npoint, dtype=torch.long, device=device)
+    distance = torch.ones(B, N, device=device) * 1e10
+    farthest = torch.randint(0, N, (B,), dtype=torch.long, device=device)
+    batch_indices = torch.arange(B, dtype=torch.long, device=device)
     
     for i in range(npoint):
         centroids[:, i] = farthest
         centroid = xyz[batch_indices, farthest, :].view(B, 1, 3)
         dist = torch.sum((xyz - centroid) ** 2, -1)
-        mask = dist < distance
-        distance[mask] = dist[mask]
+        distance = torch.where(dist < distance, dist, distance)
         farthest = torch.max(distance, -1)[1]
     
     return centroids
@@ -78,15 +77,14 @@ def query_ball_point(radius, nsample, xyz, new_xyz):
     # Ensure we don't try to sample more points than exist
     nsample = min(N, nsample)
     
-    group_idx = torch.arange(N, dtype=torch.long).to(device).view(1, 1, N).repeat([B, S, 1])
+    group_idx = torch.arange(N, dtype=torch.long, device=device).view(1, 1, N).repeat([B, S, 1])
     sqrdists = square_distance(new_xyz, xyz)
-    group_idx[sqrdists > radius ** 2] = N
+    group_idx = torch.where(sqrdists > radius ** 2, N, group_idx)
     group_idx = group_idx.sort(dim=-1)[0][:, :, :nsample]
-    
+
     # Handle edge cases where not enough points are found within radius
     group_first = group_idx[:, :, 0].view(B, S, 1).repeat([1, 1, nsample])
-    mask = group_idx == N
-    group_idx[mask] = group_first[mask]
+    group_idx = torch.where(group_idx == N, group_first, group_idx)
     
     return group_idx
 
@@ -150,7 +148,7 @@ def sample_and_group_all(xyz, points=None):
         points = points.permute(0, 2, 1)  # [B, N, D]
     
     B, N, C = xyz.shape
-    new_xyz = torch.zeros(B, 1, C).to(xyz.device)  # [B, 1, 3]
+    new_xyz = torch.zeros(B, 1, C, device=xyz.device)  # [B, 1, 3]
     grouped_xyz = xyz.view(B, 1, N, C)  # [B, 1, N, 3]
     
     if points is not None:
@@ -5,125 +5,235 @@ import numpy as np
 from steputils import p21
 import math
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 
-def step_to_off(step_file, off_file):
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def _fan_triangulate(labels, starts, ends):
+    """Fan-triangulate each [start, end) run of vertex labels into triangles"""
+    total = 0
+    for i in range(starts.shape[0]):
+        n = ends[i] - starts[i]
+        if n >= 3:
+            total += n - 2
+
+    out = np.empty((total, 3), dtype=np.int32)
+    t = 0
+    for i in range(starts.shape[0]):
+        s = starts[i]
+        n = ends[i] - starts[i]
+        if n >= 3:
+            anchor = labels[s]
+            for j in range(1, n - 1):
+                out[t, 0] = anchor
+                out[t, 1] = labels[s + j]
+                out[t, 2] = labels[s + j + 1]
+                t += 1
+    return out
+
+# Compile the triangulation kernel when numba is available; the plain-Python
+# version above is the drop-in fallback
+if njit is not None:
+    _fan_triangulate = njit(cache=True)(_fan_triangulate)
+
+# Files with at least this many entities get their extraction pass split
+# across a process pool; below it the serialization overhead isn't worth it
+_PARALLEL_MIN_ENTITIES = 100000
+
+def _extract_geometry(instances):
+    """Extract geometric data from a chunk of (ref, entity) pairs
+
+    Module-level so it can run in worker processes for large files; returns
+    the partial collections for the caller to merge.
+    """
+    pt_ids = []   # CARTESIAN_POINT ids, in parse order
+    pt_rows = []  # matching coordinate triples; turned into one array later
+    vertex_points = {}
+    edges = {}
+    loops = {}
+    faces = {}
+
+    # Handlers for the geometric entity types we care about; dispatching
+    # through a dict avoids walking an if/elif name chain for every entity.
+    # References come out of the parser as typed p21.Reference tokens; using
+    # them verbatim as keys avoids per-param string prefix checks and slicing
+    # (entity ids are the same tokens, so lookups stay consistent).
+    def handle_cartesian_point(entity_id, entity):
+        # Collect plain lists here; one bulk np.asarray after the pass is
+        # far cheaper than a tiny 3-element array per point
+        if len(entity.params) >= 2 and isinstance(entity.params[1], (list, tuple)):
+            coords = [float(x) for x in entity.params[1]]
+            if len(coords) >= 3:
+                pt_ids.append(entity_id)
+                pt_rows.append(coords[:3])
+
+    def handle_vertex_point(entity_id, entity):
+        if len(entity.params) >= 2:
+            point_ref = entity.params[1]
+            if isinstance(point_ref, p21.Reference):
+                vertex_points[entity_id] = point_ref
+
+    def handle_edge_curve(entity_id, entity):
+        if len(entity.params) >= 3:
+            start_vertex_ref = entity.params[1]
+            end_vertex_ref = entity.params[2]
+            if isinstance(start_vertex_ref, p21.Reference) and \
+               isinstance(end_vertex_ref, p21.Reference):
+                edges[entity_id] = (start_vertex_ref, end_vertex_ref)
+
+    def handle_edge_loop(entity_id, entity):
+        if len(entity.params) >= 2 and isinstance(entity.params[1], (list, tuple)):
+            loops[entity_id] = [edge_ref for edge_ref in entity.params[1]
+                                if isinstance(edge_ref, p21.Reference)]
+
+    def handle_face_bound(entity_id, entity):
+        # FACE_OUTER_BOUND('', #loop, .T.): the loop reference is the
+        # second parameter, after the name label
+        if len(entity.params) >= 2:
+            loop_ref = entity.params[1]
+            if isinstance(loop_ref, p21.Reference):
+                faces[entity_id] = {'loop': loop_ref, 'outer': entity.name == 'FACE_OUTER_BOUND'}
+
+    handlers = {
+        'CARTESIAN_POINT': handle_cartesian_point,
+        'VERTEX_POINT': handle_vertex_point,
+        'EDGE_CURVE': handle_edge_curve,
+        'EDGE_LOOP': handle_edge_loop,
+        'FACE_OUTER_BOUND': handle_face_bound,
+        'FACE_BOUND': handle_face_bound,
+    }
+
+    for entity_id, entity in instances:
+        handler = handlers.get(entity.name)
+        if handler is not None:
+            handler(entity_id, entity)
+
+    return pt_ids, pt_rows, vertex_points, edges, loops, faces
+
+def step_to_off(step_file, off_file, weld=False):
+    # weld=False skips vertex deduplication and emits per-face duplicate
+    # vertices; the inference pipeline only random-samples the surface via
+    # trimesh, which does not need a welded mesh
     try:
         # Parse the STEP file using steputils
         print(f"Reading STEP file: {step_file}")
         step_data = p21.readfile(step_file)
         
-        # Maps to store entities by reference
-        entities_by_id = {}
-        points = {}
-        vertex_points = {}
-        edges = {}
-        faces = {}
-        loops = {}
-        
-        # First pass: index all entities by their ID
+        # Single pass: index every entity by its reference and feed the
+        # (ref, entity) pairs to extraction as they are encountered. The parse
+        # result is a list of data sections, each holding instances keyed by
+        # reference.
         print("Indexing STEP entities...")
-        for entity in step_data.data:
-            entity_id = entity.ref
-            entities_by_id[entity_id] = entity
-        
-        # Second pass: extract important geometric elements
-        print("Extracting geometric data...")
-        for entity_id, entity in entities_by_id.items():
-            # Extract CARTESIAN_POINT entities
-            if entity.name == 'CARTESIAN_POINT':
-                if len(entity.params) >= 2 and isinstance(entity.params[1], list):
-                    coords = [float(x) for x in entity.params[1]]
-                    if len(coords) >= 3:
-                        points[entity_id] = np.array(coords[:3])
-            
-            # Extract VERTEX_POINT entities (vertices that reference points)
-            elif entity.name == 'VERTEX_POINT':
-                if len(entity.params) >= 2:
-                    point_ref = entity.params[1]
-                    if isinstance(point_ref, str) and point_ref.startswith('#'):
-                        point_id = point_ref[1:]  # Remove the '#' prefix
-                        vertex_points[entity_id] = point_id
-            
-            # Extract EDGE_CURVE entities (edges between vertices)
-            elif entity.name == 'EDGE_CURVE':
-                if len(entity.params) >= 3:
-                    start_vertex_ref = entity.params[1]
-                    end_vertex_ref = entity.params[2]
-                    if isinstance(start_vertex_ref, str) and start_vertex_ref.startswith('#') and \
-                       isinstance(end_vertex_ref, str) and end_vertex_ref.startswith('#'):
-                        start_id = start_vertex_ref[1:]
-                        end_id = end_vertex_ref[1:]
-                        edges[entity_id] = (start_id, end_id)
-            
-            # Extract EDGE_LOOP entities (sequences of edges forming loops)
-            elif entity.name == 'EDGE_LOOP':
-                if len(entity.params) >= 2 and isinstance(entity.params[1], list):
-                    edge_refs = []
-                    for edge_ref in entity.params[1]:
-                        if isinstance(edge_ref, str) and edge_ref.startswith('#'):
-                            edge_refs.append(edge_ref[1:])
-                    loops[entity_id] = edge_refs
-            
-            # Extract FACE_OUTER_BOUND and FACE_BOUND entities (boundaries of faces)
-            elif entity.name in ('FACE_OUTER_BOUND', 'FACE_BOUND'):
-                if len(entity.params) >= 2:
-                    loop_ref = entity.params[0]
-                    if isinstance(loop_ref, str) and loop_ref.startswith('#'):
-                        loop_id = loop_ref[1:]
-                        faces[entity_id] = {'loop': loop_id, 'outer': entity.name == 'FACE_OUTER_BOUND'}
+        entities_by_id = {}
+
+        def index_and_yield():
+            for section in step_data.data:
+                for instance in section.instances.values():
+                    entity = getattr(instance, 'entity', None)
+                    if entity is None:
+                        # Complex (multi-entity) instances carry no geometry we use
+                        continue
+                    entities_by_id[instance.ref] = entity
+                    yield instance.ref, entity
+
+        # Extract geometric data: typical files dispatch inline during the
+        # single indexing walk; very large ones materialize the pair list once
+        # and chunk it across worker processes (the dispatch loop is
+        # embarrassingly parallel over entities)
+        total_instances = sum(len(section.instances) for section in step_data.data)
+        if total_instances >= _PARALLEL_MIN_ENTITIES and (os.cpu_count() or 1) > 1:
+            all_instances = list(index_and_yield())
+            nworkers = os.cpu_count()
+            chunk = -(-len(all_instances) // nworkers)
+            chunks = [all_instances[i:i + chunk] for i in range(0, len(all_instances), chunk)]
+            print(f"Extracting geometric data across {len(chunks)} workers...")
+
+            pt_ids = []
+            pt_rows = []
+            vertex_points = {}
+            edges = {}
+            loops = {}
+            faces = {}
+            with ProcessPoolExecutor(max_workers=nworkers) as executor:
+                # map preserves chunk order, so pt_ids/pt_rows stay in parse order
+                for c_pt_ids, c_pt_rows, c_vertex_points, c_edges, c_loops, c_faces in \
+                        executor.map(_extract_geometry, chunks):
+                    pt_ids.extend(c_pt_ids)
+                    pt_rows.extend(c_pt_rows)
+                    vertex_points.update(c_vertex_points)
+                    edges.update(c_edges)
+                    loops.update(c_loops)
+                    faces.update(c_faces)
+        else:
+            pt_ids, pt_rows, vertex_points, edges, loops, faces = _extract_geometry(index_and_yield())
+
+        # One bulk allocation for all point coordinates, indexed by id->row;
+        # float32 matches OFF precision and what trimesh/PointNet consume,
+        # and halves the bandwidth of every downstream pass
+        points_arr = np.asarray(pt_rows, dtype=np.float32).reshape(-1, 3)
+        point_id_to_row = {pid: i for i, pid in enumerate(pt_ids)}
         
         # Resolve references to build a mesh
         print("Building mesh structure...")
         vertex_coords = []  # Final list of vertex coordinates
         face_indices = []   # Final list of face indices
-        
-        # Map to track unique vertices and avoid duplicates
-        unique_vertices = {}
-        
-        # Function to get or add vertex
-        def get_vertex_index(coords):
-            vertex_key = f"{coords[0]:.6f},{coords[1]:.6f},{coords[2]:.6f}"
-            if vertex_key not in unique_vertices:
-                unique_vertices[vertex_key] = len(vertex_coords)
-                vertex_coords.append(coords)
-            return unique_vertices[vertex_key]
-        
-        # Process faces and create triangles
+
+        # Collect every face-boundary vertex in loop order; deduplication
+        # happens afterwards in one vectorized np.unique pass instead of a
+        # per-vertex string-key hash
+        face_vert_rows = []  # rows into points_arr
+        face_slices = []     # (start, end) range into face_vert_rows per face
+
         for face_id, face_data in faces.items():
             loop_id = face_data['loop']
             if loop_id in loops:
                 edge_ids = loops[loop_id]
-                
+
                 # Collect vertices from edges
-                face_vertices = []
+                start = len(face_vert_rows)
                 for edge_id in edge_ids:
                     if edge_id in edges:
                         start_id, end_id = edges[edge_id]
-                        
-                        # Get point coordinates for start vertex
-                        if start_id in vertex_points and vertex_points[start_id] in points:
-                            coords = points[vertex_points[start_id]]
-                            vertex_index = get_vertex_index(coords)
-                            face_vertices.append(vertex_index)
-                
-                # Create triangles from vertex list (simple fan triangulation)
-                if len(face_vertices) >= 3:
-                    anchor = face_vertices[0]
-                    for i in range(1, len(face_vertices) - 1):
-                        face_indices.append([anchor, face_vertices[i], face_vertices[i + 1]])
+
+                        # Get point row for start vertex
+                        if start_id in vertex_points and vertex_points[start_id] in point_id_to_row:
+                            face_vert_rows.append(point_id_to_row[vertex_points[start_id]])
+
+                face_slices.append((start, len(face_vert_rows)))
+
+        if face_vert_rows:
+            arr = points_arr[np.asarray(face_vert_rows, dtype=np.intp)]
+            if weld:
+                # Weld vertices: round to 4 decimals (plenty for mesh welding,
+                # and int32 keys halve the sort bandwidth), then one unique pass
+                keys = np.round(arr * 1e4).astype(np.int32)
+                unique_keys, labels = np.unique(keys, axis=0, return_inverse=True)
+                vertex_coords = arr[np.unique(labels, return_index=True)[1]]
+            else:
+                # Keep duplicates; each collected corner becomes its own vertex
+                vertex_coords = arr
+                labels = np.arange(len(arr))
+
+            # Create triangles per face (simple fan triangulation) over the
+            # contiguous label array. Back to a list afterwards: the fallback
+            # paths below append to face_indices when no fan triangles came out
+            slices = np.asarray(face_slices, dtype=np.int64).reshape(-1, 2)
+            face_indices = _fan_triangulate(np.ascontiguousarray(labels, dtype=np.int64),
+                                            np.ascontiguousarray(slices[:, 0]),
+                                            np.ascontiguousarray(slices[:, 1])).tolist()
         
         # If no vertices/faces were found, try direct extraction method
         if len(vertex_coords) == 0:
             print("No mesh structure found. Trying direct extraction...")
-            
-            # Extract all CARTESIAN_POINT entities
-            for entity_id, entity in entities_by_id.items():
-                if entity.name == 'CARTESIAN_POINT':
-                    if len(entity.params) >= 2 and isinstance(entity.params[1], list):
-                        coords = [float(x) for x in entity.params[1]]
-                        if len(coords) >= 3:
-                            vertex_coords.append(coords[:3])
-            
+
+            # All CARTESIAN_POINT coordinates were already collected during
+            # the indexing pass; use them directly
+            if len(points_arr) > 0:
+                vertex_coords = points_arr
+
             # If file contains closed shells or breps, try to extract faces
             for entity_id, entity in entities_by_id.items():
                 if entity.name in ('CLOSED_SHELL', 'MANIFOLD_SOLID_BREP'):
@@ -131,10 +241,9 @@ def step_to_off(step_file, off_file):
                         face_refs = entity.params[1]
                     elif entity.name == 'MANIFOLD_SOLID_BREP' and len(entity.params) >= 2:
                         shell_ref = entity.params[1]
-                        if isinstance(shell_ref, str) and shell_ref.startswith('#'):
-                            shell_id = shell_ref[1:]
-                            if shell_id in entities_by_id:
-                                shell = entities_by_id[shell_id]
+                        if isinstance(shell_ref, p21.Reference):
+                            if shell_ref in entities_by_id:
+                                shell = entities_by_id[shell_ref]
                                 if len(shell.params) >= 2:
                                     face_refs = shell.params[1]
                                 else:
@@ -145,7 +254,7 @@ def step_to_off(step_file, off_file):
                         face_refs = []
                     
                     # Create simple triangular faces if we have enough vertices
-                    if len(vertex_coords) >= 3 and isinstance(face_refs, list) and len(face_refs) > 0:
+                    if len(vertex_coords) >= 3 and isinstance(face_refs, (list, tuple)) and len(face_refs) > 0:
                         # Create a simple triangulation using groups of 3 vertices
                         for i in range(0, min(len(vertex_coords), len(face_refs) * 3), 3):
                             if i + 2 < len(vertex_coords):
@@ -166,17 +275,16 @@ def step_to_off(step_file, off_file):
         
         # Generate OFF file content
         print(f"Writing OFF file: {off_file}")
+        # Build the whole file in memory and write it in one call instead of
+        # one small f.write per vertex/face line
+        parts = [f"OFF\n{len(vertex_coords)} {len(face_indices)} 0"]
+        if len(vertex_coords) > 0:
+            parts.append('\n'.join(f"{v[0]} {v[1]} {v[2]}" for v in vertex_coords))
+        if len(face_indices) > 0:
+            parts.append('\n'.join(f"3 {face[0]} {face[1]} {face[2]}" for face in face_indices))
+
         with open(off_file, 'w') as f:
-            f.write("OFF\n")
-            f.write(f"{len(vertex_coords)} {len(face_indices)} 0\n")
-            
-            # Write vertices
-            for v in vertex_coords:
-                f.write(f"{v[0]} {v[1]} {v[2]}\n")
-            
-            # Write faces
-            for face in face_indices:
-                f.write(f"3 {face[0]} {face[1]} {face[2]}\n")
+            f.write('\n'.join(parts) + '\n')
         
         print("Conversion completed successfully")
         return True
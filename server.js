@@ -145,6 +145,104 @@ function convertStepToOff(stepFilePath) {
   });
 }
 
+// Long-lived Python inference worker: loads the PointNet++ model once and
+// serves one JSON request per stdin line, one JSON result per stdout line
+// (responses come back in request order).
+let inferenceWorker = null;
+let inferenceWorkerReady = null;
+const pendingPredictions = [];
+
+function startInferenceWorker() {
+  const worker = spawn('python', [
+    path.join(__dirname, 'python_scripts/inference_server.py')
+  ]);
+
+  let buffer = '';
+  let isReady = false;
+  let readyResolve, readyReject;
+  inferenceWorkerReady = new Promise((resolve, reject) => {
+    readyResolve = resolve;
+    readyReject = reject;
+  });
+  // Failed startups reject every queued request; don't crash on that
+  inferenceWorkerReady.catch(() => {});
+
+  worker.stdout.on('data', (data) => {
+    buffer += data.toString();
+    let newlineIndex;
+    while ((newlineIndex = buffer.indexOf('\n')) !== -1) {
+      const line = buffer.slice(0, newlineIndex);
+      buffer = buffer.slice(newlineIndex + 1);
+      if (!line.trim()) continue;
+
+      if (!isReady) {
+        // First line is the handshake: {"ready": true} or a load error
+        isReady = true;
+        let status = {};
+        try { status = JSON.parse(line); } catch (e) {}
+        if (status.error) {
+          console.error(`Inference worker failed to start: ${status.error}`);
+          readyReject(new Error(status.error));
+        } else {
+          console.log('Inference worker ready');
+          readyResolve();
+        }
+        continue;
+      }
+
+      const pending = pendingPredictions.shift();
+      if (pending) pending.resolve(line);
+    }
+  });
+
+  worker.stderr.on('data', (data) => {
+    console.error(`Inference Worker Error: ${data.toString().trim()}`);
+  });
+
+  // Fires when the process can't be spawned at all (e.g. python missing);
+  // without a listener Node raises an unhandled ChildProcess error
+  worker.on('error', (err) => {
+    console.error(`Inference worker spawn error: ${err.message}`);
+    if (!isReady) {
+      isReady = true;
+      readyReject(new Error(`Inference worker failed to start: ${err.message}`));
+    }
+    while (pendingPredictions.length > 0) {
+      pendingPredictions.shift().reject(err);
+    }
+    inferenceWorker = null;
+  });
+
+  worker.on('close', (code) => {
+    console.error(`Inference worker exited with code ${code}`);
+    if (!isReady) {
+      // Died before the handshake line (e.g. ImportError on startup):
+      // settle readiness so waiting requests get an error response instead
+      // of hanging forever with their uploads never cleaned up
+      isReady = true;
+      readyReject(new Error(`Inference worker exited with code ${code} before becoming ready`));
+    }
+    while (pendingPredictions.length > 0) {
+      pendingPredictions.shift().reject(new Error('Inference worker exited'));
+    }
+    inferenceWorker = null; // respawned lazily on the next request
+  });
+
+  inferenceWorker = worker;
+  return worker;
+}
+
+function runInference(cadFile) {
+  if (!inferenceWorker) {
+    startInferenceWorker();
+  }
+  return inferenceWorkerReady.then(() => new Promise((resolve, reject) => {
+    pendingPredictions.push({ resolve, reject });
+    inferenceWorker.stdin.write(
+      JSON.stringify({ cad_file: cadFile, output_points: true }) + '\n');
+  }));
+}
+
 const fileFilter = (req, file, cb) => {
   const fileName = file.originalname.toLowerCase();
   if (fileName.endsWith('.off') || fileName.endsWith('.stl') || 
@@ -183,57 +281,36 @@ app.post('/api/classify', upload.single('cadFile'), async (req, res) => {
     
     console.log(`Processing file: ${filePath}`);
 
-    // Run the Python inference script
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, 'python_scripts/inference.py'),
-      '--cad_file', filePath,
-      '--output_points', 'true'
-    ]);
-
-    let outputData = '';
-    let errorData = '';
-
-    pythonProcess.stdout.on('data', (data) => {
-      outputData += data.toString();
-    });
-
-    pythonProcess.stderr.on('data', (data) => {
-      errorData += data.toString();
-      console.error(`Python Error: ${data}`);
-    });
-
-    pythonProcess.on('close', (code) => {
+    // Send the file to the long-lived inference worker; the model stays
+    // loaded across requests instead of being reconstructed per spawn
+    let outputData;
+    try {
+      outputData = await runInference(filePath);
+    } finally {
       // Clean up the uploaded file and converted file if any
       fs.unlink(req.file.path, (err) => {
         if (err) console.error(`Error deleting original file: ${err}`);
       });
-      
+
       if (convertedFile && convertedFile !== req.file.path) {
         fs.unlink(convertedFile, (err) => {
           if (err) console.error(`Error deleting converted file: ${err}`);
         });
       }
+    }
 
-      if (code !== 0) {
-        return res.status(500).json({ 
-          error: 'Error processing CAD file', 
-          details: errorData 
-        });
-      }
-
-      try {
-        // Parse the JSON output from Python
-        const results = JSON.parse(outputData);
-        console.log(`Classification results: ${results.predictedClass} (confidence: ${results.confidence}%)`);
-        res.json(results);
-      } catch (error) {
-        console.error('Error parsing Python output:', error);
-        res.status(500).json({ 
-          error: 'Error parsing classification results',
-          rawOutput: outputData
-        });
-      }
-    });
+    try {
+      // Parse the JSON output from Python
+      const results = JSON.parse(outputData);
+      console.log(`Classification results: ${results.predictedClass} (confidence: ${results.confidence}%)`);
+      res.json(results);
+    } catch (error) {
+      console.error('Error parsing Python output:', error);
+      res.status(500).json({
+        error: 'Error parsing classification results',
+        rawOutput: outputData
+      });
+    }
   } catch (error) {
     // Clean up files on error
     if (req.file.path) {
@@ -257,6 +334,10 @@ app.get('/', (req, res) => {
 });
 
 
+// Start the inference worker alongside the server so the model (and any
+// warmup) loads before the first request arrives
+startInferenceWorker();
+
 app.listen(port, () => {
   console.log(`Server running on port ${port}`);
 });